@@ -7,46 +7,250 @@ import numpy as np
 import pennylane as qml
 from sklearn.svm import SVC
 from numpy.typing import NDArray
-from typing import Tuple, List
-from utils.utils import get_qnode_instance
+from typing import Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils.utils import get_qnode_instance, get_score
 
 
 class Quantum_Kernel_Classification:
-    def __init__(self, embedding_circuit: callable, num_qubits: int) -> None:
+    def __init__(
+        self,
+        embedding_circuit: callable,
+        num_qubits: int,
+        cache_size: int = 100000,
+        broadcasting: bool = False,
+        num_workers: int = 1,
+        statevector: bool = True,
+        device_name: str = "lightning.qubit",
+    ) -> None:
         """
         Object that can run the quantum kernel classification algorithm
 
         Parameters:
         - embedding_circuit (callable): The Python function describing the embedding circuit of the data. It must use the Pennylane architecture to create the circuit.
         - num_qubits (int): The number of qubits of the embedding circuit.
+        - cache_size (int = 100000): The maximum number of kernel values, and of state vectors, kept in memory. When a cache is full, its least recently used entry is discarded.
+        - broadcasting (bool = False): If the kernel circuit is run once for all the pairs of feature vectors using Pennylane's parameter broadcasting.
+                                       The embedding circuit must then accept a batch of feature vectors of shape (batch, features), like the ones in utils.quantum_embeddings.
+                                       On default.qubit, the batch is simulated natively in one circuit. On the other devices, it is split into one circuit per pair by Pennylane.
+                                       The adjoint of the amplitude embedding can not be broadcasted on default.qubit, so this embedding should be used with the default statevector=True.
+        - num_workers (int = 1): The number of processes evaluating the kernel circuits in parallel when broadcasting is not used. The embedding circuit must then be picklable.
+        - statevector (bool = True): If the kernel values are computed from the state vector of each embedded feature vector instead of running the kernel circuit for each pair.
+                                     Only one circuit per feature vector is then simulated. The device must give access to the state of the circuit.
+        - device_name (str = "lightning.qubit"): The name of the device that will run the circuits. It must be valid with the qml.device function.
 
         Returns:
         None
         """
         self.embedding = embedding_circuit
+        self._adj_embedding = qml.adjoint(self.embedding)
         self.num_qubits = num_qubits
+        self.device_name = device_name
+        self.broadcasting = broadcasting
+        # Only default.qubit runs the broadcasted circuits natively
+        expand_broadcasting = self.broadcasting and self.device_name != "default.qubit"
         self.kernel_circuit = get_qnode_instance(
-            self.get_kernel_embedding, self.num_qubits
+            self.get_kernel_embedding,
+            self.num_qubits,
+            self.device_name,
+            expand_broadcasting=expand_broadcasting,
+        )
+        self.cache_size = cache_size
+        self.num_workers = num_workers
+        self.statevector = statevector
+        self._kernel_cache = OrderedDict()
+        self.state_circuit = get_qnode_instance(
+            self.get_state_embedding,
+            self.num_qubits,
+            self.device_name,
+            expand_broadcasting=expand_broadcasting,
         )
+        self._state_cache = OrderedDict()
 
     def get_kernel_embedding(
         self, a: NDArray[np.float_], b: NDArray[np.float_]
-    ) -> List[float]:
+    ) -> float:
         """
         Method that creates the complete kernel circuit to be used in the classifier.
 
         Parameters:
         - self: The Quantum_Kernel_Classification object that will use this circuit.
-        - a (NDArray[np.float_]): The first feature vector to be passed to the circuit.
-        - b (NDArray[np.float_]): The second feature vector to be passed to the circuit.
+        - a (NDArray[np.float_]): The first feature vector to be passed to the circuit. It can also be a batch of feature vectors if broadcasting is used.
+        - b (NDArray[np.float_]): The second feature vector to be passed to the circuit. It can also be a batch of feature vectors if broadcasting is used.
 
         Returns:
-        List[float]: The probabilities associated with each basis state in the circuit. They will not be directly accessible
-                     since a QNode needs to be created with this function to access them.
+        float: The probability of measuring the zero state, which is the kernel value. It will not be directly accessible
+               since a QNode needs to be created with this function to access it.
         """
         self.embedding(a)
-        qml.adjoint(self.embedding)(b)
-        return qml.probs(wires=range(self.num_qubits))
+        self._adj_embedding(b)
+        return qml.expval(
+            qml.Projector([0] * self.num_qubits, wires=range(self.num_qubits))
+        )
+
+    def get_state_embedding(self, a: NDArray[np.float_]) -> NDArray[np.complex_]:
+        """
+        Method that creates the embedding circuit returning the state of the qubits, used to compute the kernel from the state vectors.
+
+        Parameters:
+        - self: The Quantum_Kernel_Classification object that will use this circuit.
+        - a (NDArray[np.float_]): The feature vector to be embedded. It can also be a batch of feature vectors if broadcasting is used.
+
+        Returns:
+        NDArray[np.complex_]: The state vector of the embedded feature vector. It will not be directly accessible
+                              since a QNode needs to be created with this function to access it.
+        """
+        self.embedding(a)
+        return qml.state()
+
+    def get_states(self, feature_vectors: NDArray[np.float_]) -> NDArray[np.complex_]:
+        """
+        Method that gives the state vectors of the embedded feature vectors. Each state is only simulated once and then kept in a cache
+        of at most cache_size states.
+
+        Parameters:
+        - self: The Quantum_Kernel_Classification object that will use this circuit.
+        - feature_vectors (NDArray[np.float_]): The feature vectors to embed.
+
+        Returns:
+        NDArray[np.complex_]: The matrix of the state vectors, one per row.
+        """
+        keys = [
+            np.asarray(vector, dtype=np.float64).tobytes() for vector in feature_vectors
+        ]
+        states = [None] * len(keys)
+        missing = []
+        for k, key in enumerate(keys):
+            if key in self._state_cache:
+                self._state_cache.move_to_end(key)
+                states[k] = self._state_cache[key]
+            else:
+                missing.append(k)
+
+        if missing:
+            if self.broadcasting:
+                computed = self.state_circuit(feature_vectors[missing])
+            else:
+                computed = [self.state_circuit(feature_vectors[k]) for k in missing]
+            for k, state in zip(missing, computed):
+                states[k] = state
+                self._state_cache[keys[k]] = state
+            while len(self._state_cache) > self.cache_size:
+                self._state_cache.popitem(last=False)
+
+        return np.stack(states)
+
+    def get_kernel_values(
+        self, A: NDArray[np.float_], B: NDArray[np.float_]
+    ) -> NDArray[np.float_]:
+        """
+        Method that gives the kernel values of pairs of feature vectors, the kth pair being (A[k], B[k]). Since the kernel is symmetric, the value of (a, b) and (b, a)
+        is only computed once and kept in a cache so that the circuit is not run again for a pair already seen. The pairs missing from the cache are either
+        evaluated all at once with broadcasting or one at a time.
+
+        Parameters:
+        - self: The Quantum_Kernel_Classification object that will use this circuit.
+        - A (NDArray[np.float_]): The first feature vectors of the pairs.
+        - B (NDArray[np.float_]): The second feature vectors of the pairs.
+
+        Returns:
+        NDArray[np.float_]: The probabilities of measuring the zero state after the kernel circuit for each pair.
+        """
+        values = np.empty(len(A), dtype=np.float64)
+        keys = []
+        missing = []
+        for k, (a, b) in enumerate(zip(A, B)):
+            key_a = np.asarray(a, dtype=np.float64).tobytes()
+            key_b = np.asarray(b, dtype=np.float64).tobytes()
+            key = (key_a, key_b) if key_a <= key_b else (key_b, key_a)
+            keys.append(key)
+            if key in self._kernel_cache:
+                self._kernel_cache.move_to_end(key)
+                values[k] = self._kernel_cache[key]
+            else:
+                missing.append(k)
+
+        if not missing:
+            return values
+
+        if self.broadcasting:
+            computed = self.kernel_circuit(A[missing], B[missing])
+        elif self.num_workers > 1 and len(missing) > 1:
+            # Balanced chunks: the first len(missing) % num_workers chunks get one more pair
+            chunks = np.array_split(np.array(missing), self.num_workers)
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                results = executor.map(
+                    _evaluate_kernel_pairs,
+                    [self.embedding] * len(chunks),
+                    [self.num_qubits] * len(chunks),
+                    [self.device_name] * len(chunks),
+                    [A[chunk] for chunk in chunks],
+                    [B[chunk] for chunk in chunks],
+                )
+                computed = np.concatenate(list(results))
+        else:
+            computed = self.evaluate_kernel_pairs(A[missing], B[missing])
+        values[missing] = computed
+
+        for k, value in zip(missing, computed):
+            self._kernel_cache[keys[k]] = value
+        while len(self._kernel_cache) > self.cache_size:
+            self._kernel_cache.popitem(last=False)
+        return values
+
+    def evaluate_kernel_pairs(
+        self, A: NDArray[np.float_], B: NDArray[np.float_]
+    ) -> NDArray[np.float_]:
+        """
+        Method that runs the kernel circuit for each pair of feature vectors (A[k], B[k]), one pair at a time and without using the cache.
+
+        Parameters:
+        - self: The Quantum_Kernel_Classification object that will use this circuit.
+        - A (NDArray[np.float_]): The first feature vectors of the pairs.
+        - B (NDArray[np.float_]): The second feature vectors of the pairs.
+
+        Returns:
+        NDArray[np.float_]: The probabilities of measuring the zero state after the kernel circuit for each pair.
+        """
+        values = np.empty(len(A), dtype=np.float64)
+        for k, (a, b) in enumerate(zip(A, B)):
+            values[k] = self.kernel_circuit(a, b)
+        return values
+
+    def get_kernel_matrix(
+        self, A: NDArray[np.float_], B: NDArray[np.float_]
+    ) -> NDArray[np.float_]:
+        """
+        Method that gives the Gram matrix of the kernel between two sets of feature vectors. If the same array is given twice,
+        the matrix is symmetric and only its upper triangle is evaluated.
+
+        Parameters:
+        - self: The Quantum_Kernel_Classification object that will use this circuit.
+        - A (NDArray[np.float_]): The feature vectors associated with the rows of the matrix.
+        - B (NDArray[np.float_]): The feature vectors associated with the columns of the matrix.
+
+        Returns:
+        NDArray[np.float_]: The matrix of the kernel values, of shape (len(A), len(B)).
+        """
+        # The kernel value is the fidelity |<psi(a)|psi(b)>|^2 of the two embedded states
+        if self.statevector:
+            states_A = self.get_states(A)
+            states_B = states_A if A is B else self.get_states(B)
+            return np.abs(states_A.conj() @ states_B.T) ** 2
+
+        # The Gram matrix of the training vectors with themselves is symmetric and its diagonal is one.
+        # Only its upper triangle needs to be evaluated by the circuit.
+        if A is B:
+            rows, columns = np.triu_indices(len(A), k=1)
+            K = np.empty((len(A), len(A)))
+            np.fill_diagonal(K, 1.0)
+            K[rows, columns] = self.get_kernel_values(A[rows], A[columns])
+            K[columns, rows] = K[rows, columns]
+            return K
+        rows = np.repeat(np.arange(len(A)), len(B))
+        columns = np.tile(np.arange(len(B)), len(A))
+        return self.get_kernel_values(A[rows], B[columns]).reshape(len(A), len(B))
 
     def run(
         self,
@@ -65,16 +269,13 @@ class Quantum_Kernel_Classification:
         - labels: (NDArray[np.float_]): The labels associated with the feature vectors. The ones given for the prediction phase will be used
                                         to determine the precision of the classifier. The labels must be in the same order as their associated feature vector in the feature_vectors matrix.
         - training_ratio (float = 0.8): The ratio of the number of feature vectors used for training over the total number of feature vectors.
-        - svm=SVC: The support vector machine that the classifier will use. By default, the SVC from sklearn.svm is used.
+        - svm=SVC: The support vector machine that the classifier will use. By default, the SVC from sklearn.svm is used. It must accept a precomputed kernel.
 
         Returns:
         Tuple[int, NDArray[np.int_]]:  - The number of correctly predicted labels.
                                          - The prediction labels of the testing feature vectors.
         """
 
-        def qkernel(A, B):
-            return np.array([[self.kernel_circuit(a, b)[0] for b in B] for a in A])
-
         training_period = int(training_ratio * len(labels))
 
         training_vectors = feature_vectors[:training_period, :]
@@ -82,10 +283,44 @@ class Quantum_Kernel_Classification:
         training_labels = labels[:training_period]
         testing_labels = labels[training_period:]
 
-        model = svm(kernel=qkernel)
-        model.fit(training_vectors, training_labels)
+        # The Gram matrices are given to the SVM so it never calls back the kernel during the optimization.
+        # sklearn copies them into C-contiguous float64 arrays for libsvm unless they already are.
+        training_kernel = np.ascontiguousarray(
+            self.get_kernel_matrix(training_vectors, training_vectors), dtype=np.float64
+        )
+        testing_kernel = np.ascontiguousarray(
+            self.get_kernel_matrix(testing_vecors, training_vectors), dtype=np.float64
+        )
+
+        model = svm(kernel="precomputed")
+        model.fit(training_kernel, training_labels)
+
+        predictions = model.predict(testing_kernel)
+
+        return get_score(predictions, testing_labels), predictions
+
+
+def _evaluate_kernel_pairs(
+    embedding_circuit: callable,
+    num_qubits: int,
+    device_name: str,
+    A: NDArray[np.float_],
+    B: NDArray[np.float_],
+) -> NDArray[np.float_]:
+    """
+    Function run by the worker processes to evaluate a chunk of kernel pairs. The QNode is created again in the worker since it can not be sent between processes.
 
-        score = model.score(testing_vecors, testing_labels)
-        predictions = model.predict(testing_vecors)
+    Parameters:
+    - embedding_circuit (callable): The Python function describing the embedding circuit of the data.
+    - num_qubits (int): The number of qubits of the embedding circuit.
+    - device_name (str): The name of the device that will run the circuits.
+    - A (NDArray[np.float_]): The first feature vectors of the pairs.
+    - B (NDArray[np.float_]): The second feature vectors of the pairs.
 
-        return score, predictions
+    Returns:
+    NDArray[np.float_]: The probabilities of measuring the zero state after the kernel circuit for each pair.
+    """
+    kernel = Quantum_Kernel_Classification(
+        embedding_circuit, num_qubits, statevector=False, device_name=device_name
+    )
+    return kernel.evaluate_kernel_pairs(A, B)
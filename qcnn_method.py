@@ -3,7 +3,8 @@ File containing the class of the quantum convolutional neural network method. Th
 The function that runs the main algorithm is the .run method.
 """
 
-from pennylane import numpy as np
+import numpy as np
+from pennylane import numpy as pnp
 from numpy.typing import NDArray
 from typing import Tuple, List
 import pennylane as qml
@@ -16,6 +17,8 @@ class QCNN_Solver:
         self,
         embedding_circuit: callable,
         num_qubits: int,
+        broadcasting: bool = False,
+        device_name: str = "lightning.qubit",
     ) -> None:
         """
         Object that can run the quantum convolutional neural network classification algorithm. It must use the Pennylane architecture to create the circuit.
@@ -23,25 +26,62 @@ class QCNN_Solver:
         Parameters:
         - embedding_circuit (callable): The Python function describing the embedding circuit of the data.
         - num_qubits (int): The number of qubits of the embedding circuit and the ansatz.
+        - broadcasting (bool = False): If the circuit is run once for all the feature vectors using Pennylane's parameter broadcasting.
+                                       The embedding circuit must then accept a batch of feature vectors of shape (batch, features), like the ones in utils.quantum_embeddings.
+                                       On devices other than default.qubit, the batch is split into one circuit per feature vector by Pennylane, which are still executed in a single call.
+        - device_name (str = "lightning.qubit"): The name of the device that will run the circuit. It must be valid with the qml.device function.
 
         Returns:
         None
         """
         self.embedding = embedding_circuit
         self.num_qubits = num_qubits
+        self.broadcasting = broadcasting
+        # Only default.qubit runs the broadcasted circuits natively
         self.circuit_to_optimize = get_qnode_instance(
-            self.generate_qcnn_circuit, self.num_qubits
+            self.generate_qcnn_circuit,
+            self.num_qubits,
+            device_name,
+            expand_broadcasting=broadcasting and device_name != "default.qubit",
         )
         self.num_qubits
 
-        # get the number of parameters
-        self.num_params = 0
-        test_qubits = self.num_qubits
-        while test_qubits > 1:
-            self.num_params += 2 * test_qubits
-            test_qubits = int(np.ceil(test_qubits / 2))
-        self.num_params -= 2
-        self.params = 0.5 * np.random.randn(self.num_params, requires_grad=True)
+        # get the structure of the layers: the number of active qubits and the slice of their parameters
+        self._layers = []
+        num_qubits_utilized = self.num_qubits
+        num_params_utilized = 0
+        while num_qubits_utilized > 1:
+            num_layer_params = (
+                2 if num_qubits_utilized == 2 else 2 * num_qubits_utilized
+            )
+            self._layers.append(
+                (
+                    num_qubits_utilized,
+                    slice(num_params_utilized, num_params_utilized + num_layer_params),
+                )
+            )
+            num_params_utilized += num_layer_params
+            num_qubits_utilized = int(np.ceil(num_qubits_utilized / 2))
+        self.num_params = num_params_utilized
+        self.reset_params()
+
+    def reset_params(self, rng: np.random.Generator = None) -> None:
+        """
+        Method that draws new random parameters for the circuit. To run multiple trials, it should be called between them instead of
+        creating a new QCNN_Solver, so that the QNode and the structure of the layers are reused.
+
+        Parameters:
+        - self: The QCNN_Solver object whose parameters are drawn.
+        - rng (np.random.Generator = None): The random generator used to draw the parameters. If None, the global NumPy random state is used.
+
+        Returns:
+        None
+        """
+        if rng is None:
+            values = np.random.randn(self.num_params)
+        else:
+            values = rng.standard_normal(self.num_params)
+        self.params = pnp.array(0.5 * values, requires_grad=True)
 
     @staticmethod
     def pool(old_size: int) -> int:
@@ -98,25 +138,65 @@ class QCNN_Solver:
 
         Parameters:
         - self: The QCNN_Solver object that will use this circuit.
-        - feature_vector (NDArray[np.float_]): The feature vector to be encoded in the instance of the circuit.
+        - feature_vector (NDArray[np.float_]): The feature vector to be encoded in the instance of the circuit. It can also be a batch of feature vectors if broadcasting is used.
         - params (NDArray[np.float_]): The parameters to be assigned to each parametrized gate of the convolution subcircuits.
 
         Returns:
         List[float]: The probabilities associated with each basis state in the circuit. They will not be directly accessible
                      since a QNode needs to be created with this function to work.
         """
-        num_params_utilized = 0
-        num_qubits_utilized = self.num_qubits
         self.embedding(feature_vector)
-        while True:
-            num_params_utilized += self.convolution(
-                num_qubits_utilized, params[num_params_utilized:]
-            )
-            num_qubits_utilized = self.pool(num_qubits_utilized)
-            if num_qubits_utilized == 1:
-                break
+        for num_qubits_utilized, params_slice in self._layers:
+            self.convolution(num_qubits_utilized, params[params_slice])
+            self.pool(num_qubits_utilized)
         return qml.expval(qml.PauliZ(0))
 
+    def get_expectation_values(
+        self, feature_vectors: NDArray[np.float_], params: NDArray[np.float_]
+    ) -> NDArray[np.float_]:
+        """
+        Method that gives the expectation values of the QCNN circuit for a set of feature vectors with the same parameters.
+        With broadcasting, all of the feature vectors are evaluated in a single run of the circuit.
+
+        Parameters:
+        - self: The QCNN_Solver object that will use this circuit.
+        - feature_vectors (NDArray[np.float_]): The feature vectors to be encoded in the circuit.
+        - params (NDArray[np.float_]): The parameters to be assigned to each parametrized gate of the convolution subcircuits.
+
+        Returns:
+        NDArray[np.float_]: The expectation value of the circuit for each feature vector.
+        """
+        if self.broadcasting:
+            expectation_values = self.circuit_to_optimize(feature_vectors, params)
+            if qml.math.shape(expectation_values) != (len(feature_vectors),):
+                raise ValueError(
+                    f"The broadcasted circuit returned values of shape {qml.math.shape(expectation_values)} instead of ({len(feature_vectors)},)."
+                )
+            return expectation_values
+        return pnp.stack(
+            [
+                self.circuit_to_optimize(feature_vector, params)
+                for feature_vector in feature_vectors
+            ]
+        )
+
+    def get_predictions(
+        self, feature_vectors: NDArray[np.float_]
+    ) -> NDArray[np.float_]:
+        """
+        Method that predicts the labels of a set of feature vectors with the current parameters of the circuit.
+
+        Parameters:
+        - self: The QCNN_Solver object that will use this circuit.
+        - feature_vectors (NDArray[np.float_]): The feature vectors to classify.
+
+        Returns:
+        NDArray[np.float_]: The predicted label, -1 or 1, of each feature vector.
+        """
+        return np.sign(
+            np.asarray(self.get_expectation_values(feature_vectors, self.params))
+        )
+
     def run(
         self,
         feature_vectors: NDArray[np.float_],
@@ -153,25 +233,17 @@ class QCNN_Solver:
         training_labels = labels[:training_period]
         testing_labels = labels[training_period:]
 
-        predictions = np.empty_like(testing_labels)
-
         # optimizing the ansatz
         def cost_function(
             params: NDArray[np.float_],
         ):
-            resulting_labels = [
-                self.circuit_to_optimize(training_vector, params)
-                for training_vector in training_vectors
-            ]
+            resulting_labels = self.get_expectation_values(training_vectors, params)
             return error_function(resulting_labels, training_labels)
 
         self.params = optimizer_function(cost_function, self.params)
 
         # Getting the predictions
-        for i, testing_vector in enumerate(testing_vectors):
-            predictions[i] = np.sign(
-                self.circuit_to_optimize(testing_vector, self.params)
-            )
+        predictions = self.get_predictions(testing_vectors).astype(testing_labels.dtype)
 
         return get_score(predictions, testing_labels), predictions
 
@@ -215,9 +287,11 @@ class QCNN_Solver:
         training_labels = labels[:training_period]
         testing_labels = labels[training_period:]
 
-        predictions = np.empty_like(testing_labels)
-
         batch_lenght = int(len(training_labels) / num_batches)
+        batch_bounds = [
+            (batch_number * batch_lenght, (batch_number + 1) * batch_lenght)
+            for batch_number in range(num_batches)
+        ]
 
         # Optimising the weights of the interactions
         batch_number = 0
@@ -226,18 +300,13 @@ class QCNN_Solver:
             params,
         ):
             nonlocal batch_number
-            batched_training_vectors = training_vectors[
-                batch_number * batch_lenght : (batch_number + 1) * batch_lenght,
-                :,
-            ]
-            batched_training_labels = training_labels[
-                batch_number * batch_lenght : (batch_number + 1) * batch_lenght
-            ]
+            batch_start, batch_end = batch_bounds[batch_number]
+            batched_training_vectors = training_vectors[batch_start:batch_end, :]
+            batched_training_labels = training_labels[batch_start:batch_end]
 
-            resulting_labels = [
-                self.circuit_to_optimize(training_vector, params)
-                for training_vector in batched_training_vectors
-            ]
+            resulting_labels = self.get_expectation_values(
+                batched_training_vectors, params
+            )
 
             batch_number = batch_number + 1
             return error_function(resulting_labels, batched_training_labels)
@@ -245,9 +314,6 @@ class QCNN_Solver:
         self.params = optimizer_function(cost_function, self.params)
 
         # Getting the predictions
-        for i, testing_vector in enumerate(testing_vectors):
-            predictions[i] = np.sign(
-                self.circuit_to_optimize(testing_vector, self.params)
-            )
+        predictions = self.get_predictions(testing_vectors).astype(testing_labels.dtype)
 
         return get_score(predictions, testing_labels), predictions
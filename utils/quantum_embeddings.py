@@ -14,14 +14,14 @@ def angle_embedding(
 ) -> None:
     """
     Circuit of an angle embedding of a feature vector for a given number of qubits and a given rotation axis. The features are assigned
-    to the ith % num_qubits qubit.
+    to the ith % num_qubits qubit. A batch of feature vectors of shape (batch, features) can also be given to broadcast the circuit.
      - a (NDArray[np.float_]): The feature vector to encode.
      - num_qubits (int): The number of qubits of the encoding
      - rotation (str = "Y"): The rotation axis of the angle gates.
      Returns:
      None
     """
-    for i, theta in enumerate(a):
+    for i, theta in enumerate(np.transpose(a)):
         if rotation == "Y":
             qml.RY(theta, wires=(i % num_qubits))
         elif rotation == "X":
@@ -32,23 +32,23 @@ def angle_embedding(
 
 def amplitude_embedding(a: NDArray[np.float_]):
     """
-    Circuit of an amplitude embedding of a feature vector.
+    Circuit of an amplitude embedding of a feature vector. A batch of feature vectors of shape (batch, features) can also be given.
      - a (NDArray[np.float_]): The feature vector to encode.
      Returns:
      None
     """
     new_a = transform_vector_into_power_of_two_dim(a)
-    num_qubits = int(np.log2(len(new_a)))
+    num_qubits = int(np.log2(np.shape(new_a)[-1]))
 
     qml.AmplitudeEmbedding(features=new_a, wires=range(num_qubits), normalize=True)
 
 
 def iqp_embedding(a: NDArray[np.float_]):
     """
-    Circuit of an IQP embedding of a feature vector.
+    Circuit of an IQP embedding of a feature vector. A batch of feature vectors of shape (batch, features) can also be given.
      - a (NDArray[np.float_]): The feature vector to encode.
      Returns:
      None
     """
-    qubits = range(len(a))
+    qubits = range(np.shape(a)[-1])
     qml.IQPEmbedding(a, wires=qubits)
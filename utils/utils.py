@@ -46,7 +46,7 @@ def transform_vector_into_power_of_two_dim(
 ) -> NDArray[np.float_]:
     """
     Transform a feature vector into one with the same information but to the superior or equal power of two dim.
-    The remaining elements of the new array are filled with zeroes.
+    The remaining elements of the new array are filled with zeroes. For a batch of feature vectors, each of them is padded.
 
     Parameters:
     - feature_vector: NDArray[np.float_]: The feature vector to put into a power of two dimension vector.
@@ -54,17 +54,21 @@ def transform_vector_into_power_of_two_dim(
     Returns:
     NDArray[np.float_]: The new feature vector into a power of two arrays.
     """
-    if not np.log2(len(feature_vector)) % 1 == 0:
-        power_of_two = int(np.ceil(np.log2(len(feature_vector))))
+    num_features = np.shape(feature_vector)[-1]
+    if not np.log2(num_features) % 1 == 0:
+        power_of_two = int(np.ceil(np.log2(num_features)))
         new_dim = 2**power_of_two
-        new_a = np.zeros(new_dim)
-        new_a[: len(feature_vector)] = feature_vector
+        new_a = np.zeros(np.shape(feature_vector)[:-1] + (new_dim,))
+        new_a[..., :num_features] = feature_vector
         return new_a
     return feature_vector
 
 
 def get_qnode_instance(
-    circuit_function: callable, num_qubits: int, device_name: str = "default.qubit"
+    circuit_function: callable,
+    num_qubits: int,
+    device_name: str = "default.qubit",
+    expand_broadcasting: bool = False,
 ) -> QNode:
     """
     Transforms the Python function describing a Pennylane circuit into a qnode with the specified device.
@@ -72,30 +76,40 @@ def get_qnode_instance(
     - circuit_function (callable): The Python function describing the Pennylane circuit
     - num_qubits (int): The number of qubits of the circuit
     - device_name (str="default.qubit"): The name of the device being that will run the circuit. It must be valid with the qml.device function.
+    - expand_broadcasting (bool=False): If a broadcasted circuit is split into one circuit per element of the batch before being run. This is needed
+                                        for the gates and devices that do not support broadcasting. The results are still returned as one batched array.
     Returns:
     QNode: The quantum node of the circuit that can now be run.
     """
     dev = qml.device(device_name, wires=num_qubits)
-    return qml.QNode(circuit_function, dev)
+    qnode = qml.QNode(circuit_function, dev)
+    if expand_broadcasting:
+        return qml.transforms.broadcast_expand(qnode)
+    return qnode
 
 
 def get_score(
     prediction_labels: NDArray[np.float_], true_lables: NDArray[np.float_]
-) -> int:
+) -> float:
     """
-    Gets the number of accurately predicted labels by the prediction.
+    Gets the fraction of accurately predicted labels by the prediction.
     Parameters:
     - prediction_labels (NDArray[np.float_]): The labels predicted by the machine learning classifier.
     - true_lables: NDArray[np.float_]: The expected labels (The theoretical results).
     Returns:
-    int: The number of correctly predicted labels.
+    float: The fraction of correctly predicted labels.
+    Raises:
+    ValueError: If the two arrays of labels do not have the same shape or if they are empty.
     """
-    score = 0
-    for pred, true_value in zip(prediction_labels, true_lables):
-        if pred == true_value:
-            score += 1
-    score /= len(prediction_labels)
-    return score
+    prediction_labels = np.asarray(prediction_labels)
+    true_lables = np.asarray(true_lables)
+    if prediction_labels.shape != true_lables.shape:
+        raise ValueError(
+            f"The predicted labels of shape {prediction_labels.shape} do not match the expected labels of shape {true_lables.shape}."
+        )
+    if prediction_labels.size == 0:
+        raise ValueError("There are no labels to score.")
+    return float(np.mean(prediction_labels == true_lables))
 
 
 def get_accuracies(